@@ -4,12 +4,17 @@ from fastapi.responses import ORJSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from urllib.parse import urlparse, parse_qs
 import aiohttp
-from dataclasses import dataclass
-from typing import Annotated, List, Dict, Optional, Any
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from typing import Annotated, Callable, Hashable, List, Dict, Optional, Any, Tuple
 import re
 import json
-from async_lru import alru_cache
+import os
 import asyncio
+import functools
+import random
+import sys
+import time
 from enum import Enum
 
 ############################################################################
@@ -96,7 +101,32 @@ def get_eng_source(source: str) -> str:
 
 type_map = {"电视剧": "tv", "电影": "movie", "动漫": "tv", "少儿": "tv"}
 
-CAIJI_API_URL = "https://gctf.tfdh.top/api.php/provide/vod"
+## 多个兼容的采集镜像，用逗号分隔
+CAIJI_API_URLS = [
+    url.strip()
+    for url in os.environ.get(
+        "CAIJI_API_URLS", "https://gctf.tfdh.top/api.php/provide/vod"
+    ).split(",")
+    if url.strip()
+]
+
+
+class CaijiMode(str, Enum):
+    first = "first"  # 返回第一个有效结果
+    merge = "merge"  # 合并所有镜像结果并按标题和来源去重
+
+
+CAIJI_SEARCH_MODE = CaijiMode(os.environ.get("CAIJI_SEARCH_MODE", "first"))
+CAIJI_MAX_PARALLEL = int(os.environ.get("CAIJI_MAX_PARALLEL", "3"))
+if CAIJI_MAX_PARALLEL < 1:
+    raise ValueError(f"CAIJI_MAX_PARALLEL must be >= 1, got {CAIJI_MAX_PARALLEL}")
+CAIJI_TIMEOUT = 15
+## 每隔多少次搜索额外探测一个排名靠后的镜像，让被降级的镜像有机会恢复
+CAIJI_PROBE_INTERVAL = 10
+## 第一个有效结果返回后，其余镜像最多再等待 max(已用时间 * (倍数 - 1), 最短等待)，
+## merge 模式在此期间收集结果，first 模式在后台继续记录落后镜像的真实延迟
+CAIJI_GRACE_FACTOR = 3
+CAIJI_MIN_GRACE = 0.5
 
 ############################################################################
 ###############################弹幕数据结构###############################
@@ -181,38 +211,524 @@ def parse_video_data(video: dict) -> List[Anime]:
     return animes
 
 
-async def fetch_videos_from_caiji(search_title: str) -> List[Anime]:
-    """Fetch and parse videos from caiji API"""
-    animes = []
+@dataclass
+class CaijiMirror:
+    """采集镜像及其近期延迟统计，用于给镜像排序"""
+
+    url: str
+    latency: Optional[float] = None  # 指数滑动平均，单位秒，None 表示尚未测量
+    observed_at: float = 0.0
+    queried_at: float = 0.0
+    failures: int = 0
+    retry_at: float = 0.0
+
+    ALPHA = 0.3
+    PRIOR_LATENCY = 2.0
+    HALF_LIFE = 60.0
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = 30.0
+    MAX_COOLDOWN = 300.0
+
+    def score(self, now: float) -> float:
+        """近期延迟估计，长时间未测量时逐渐回归到先验值"""
+        if self.latency is None:
+            return self.PRIOR_LATENCY
+        decay = 0.5 ** ((now - self.observed_at) / self.HALF_LIFE)
+        return self.PRIOR_LATENCY + (self.latency - self.PRIOR_LATENCY) * decay
+
+    def _observe(self, elapsed: float) -> None:
+        now = time.monotonic()
+        current = self.score(now)
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency = current + self.ALPHA * (elapsed - current)
+        self.observed_at = now
+
+    def record_success(self, elapsed: float) -> None:
+        self._observe(elapsed)
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def record_failure(self) -> None:
+        self._observe(CAIJI_TIMEOUT)
+        self.failures += 1
+        if self.failures >= self.FAILURE_THRESHOLD:
+            cooldown = self.COOLDOWN * 2 ** (self.failures - self.FAILURE_THRESHOLD)
+            self.retry_at = time.monotonic() + min(cooldown, self.MAX_COOLDOWN)
+
+
+CAIJI_MIRRORS = [CaijiMirror(url) for url in CAIJI_API_URLS]
+_caiji_search_count = 0
+_caiji_background_tasks: set = set()
+
+
+def rank_caiji_mirrors() -> List[CaijiMirror]:
+    """按可用性和近期延迟选出本次要并行查询的镜像，并定期探测一个落选的镜像"""
+    global _caiji_search_count
+    _caiji_search_count += 1
+    now = time.monotonic()
+    ranked = sorted(CAIJI_MIRRORS, key=lambda m: m.score(now))
+    available = [m for m in ranked if m.retry_at <= now]
+    selected = (available or ranked)[:CAIJI_MAX_PARALLEL]
+
+    rest = [m for m in available if m not in selected]
+    if rest and _caiji_search_count % CAIJI_PROBE_INTERVAL == 0:
+        selected.append(min(rest, key=lambda m: m.queried_at))
+
+    for mirror in selected:
+        mirror.queried_at = now
+    return selected
+
+
+async def fetch_videos_from_mirror(
+    session: aiohttp.ClientSession, mirror: CaijiMirror, search_title: str
+) -> Optional[List[Anime]]:
+    """Fetch and parse videos from a single caiji mirror, None on failure"""
+    start = time.monotonic()
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                CAIJI_API_URL,
-                params={"ac": "detail", "wd": search_title},
-                timeout=aiohttp.ClientTimeout(total=15),
-            ) as resp:
-                if resp.status != 200:
-                    print(f"Failed to get data from caiji: status {resp.status}")
-                    return animes
-
-                text = await resp.text()
-                data = json.loads(text)
-
-                if not data or data.get("code") != 1:
-                    print("Failed to get data from caiji: invalid response")
-                    return animes
-
-                for video in data.get("list", []):
-                    animes.extend(parse_video_data(video))
+        async with session.get(
+            mirror.url,
+            params={"ac": "detail", "wd": search_title},
+            timeout=aiohttp.ClientTimeout(total=CAIJI_TIMEOUT),
+        ) as resp:
+            if resp.status != 200:
+                print(f"Failed to get data from {mirror.url}: status {resp.status}")
+                mirror.record_failure()
+                return None
+
+            text = await resp.text()
+            data = json.loads(text)
+
+            if not data or data.get("code") != 1:
+                print(f"Failed to get data from {mirror.url}: invalid response")
+                mirror.record_failure()
+                return None
+
+            animes = []
+            for video in data.get("list", []):
+                animes.extend(parse_video_data(video))
+            mirror.record_success(time.monotonic() - start)
+            return animes
 
     except asyncio.TimeoutError:
-        print("Timeout while fetching caiji data")
+        print(f"Timeout while fetching caiji data from {mirror.url}")
     except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
+        print(f"JSON decode error from {mirror.url}: {e}")
     except Exception as e:
-        print(f"Error in fetch_videos_from_caiji: {e}")
+        print(f"Error in fetch_videos_from_mirror {mirror.url}: {e}")
 
-    return animes
+    mirror.record_failure()
+    return None
+
+
+def merge_caiji_animes(results: List[Optional[List[Anime]]]) -> List[Anime]:
+    """合并多个镜像的结果，按 vod_name 和来源去重，保留排名靠前镜像的数据"""
+    merged = []
+    seen = set()
+    for animes in results:
+        for anime in animes or []:
+            key = (anime.title, anime.source)
+            if key not in seen:
+                seen.add(key)
+                merged.append(anime)
+    return merged
+
+
+def _grace_deadline(start: float) -> float:
+    now = time.monotonic()
+    return now + max((now - start) * (CAIJI_GRACE_FACTOR - 1), CAIJI_MIN_GRACE)
+
+
+async def _first_caiji_result(
+    tasks: List[asyncio.Future], start: float
+) -> Tuple[List[Anime], Optional[float]]:
+    """返回排名最靠前的非空结果；只有空结果时等到宽限期结束后返回空列表"""
+    deadline = None
+    pending = set(tasks)
+    while pending:
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        done, pending = await asyncio.wait(
+            pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            break
+        if deadline is None and any(task.result() is not None for task in done):
+            deadline = _grace_deadline(start)
+        for task in tasks:
+            if task in done and task.result():
+                return task.result(), deadline
+
+    return [], deadline
+
+
+async def _merge_caiji_results(
+    tasks: List[asyncio.Future], start: float
+) -> Tuple[List[Anime], Optional[float]]:
+    """等待到第一个有效结果之后的宽限期结束，合并已返回的结果"""
+    deadline = None
+    pending = set(tasks)
+    while pending:
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        done, pending = await asyncio.wait(
+            pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            break
+        if deadline is None and any(task.result() is not None for task in done):
+            deadline = _grace_deadline(start)
+
+    merged = merge_caiji_animes(
+        [task.result() if task.done() else None for task in tasks]
+    )
+    return merged, deadline
+
+
+async def _drain_caiji_tasks(
+    session: aiohttp.ClientSession,
+    mirrors: List[CaijiMirror],
+    tasks: List[asyncio.Future],
+    deadline: Optional[float],
+) -> None:
+    """
+    让落后的镜像在宽限期内完成以记录真实延迟，届时仍未返回的按失败计入
+
+    deadline 为 None 表示搜索本身被取消，此时直接取消所有请求且不计入统计。
+    """
+    try:
+        if deadline is not None:
+            pending = [task for task in tasks if not task.done()]
+            if pending:
+                await asyncio.wait(pending, timeout=max(deadline - time.monotonic(), 0))
+            for mirror, task in zip(mirrors, tasks):
+                if not task.done():
+                    mirror.record_failure()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await session.close()
+
+
+async def fetch_videos_from_caiji(
+    search_title: str, mode: Optional[CaijiMode] = None
+) -> List[Anime]:
+    """Query caiji mirrors in parallel and return the first valid or merged result"""
+    mode = mode or CAIJI_SEARCH_MODE
+    mirrors = rank_caiji_mirrors()
+    if not mirrors:
+        print("No caiji mirror configured")
+        return []
+
+    session = aiohttp.ClientSession()
+    start = time.monotonic()
+    tasks = [
+        asyncio.ensure_future(fetch_videos_from_mirror(session, mirror, search_title))
+        for mirror in mirrors
+    ]
+    deadline = None
+    try:
+        if mode == CaijiMode.merge:
+            animes, deadline = await _merge_caiji_results(tasks, start)
+        else:
+            animes, deadline = await _first_caiji_result(tasks, start)
+        deadline = deadline or time.monotonic()
+        return animes
+    finally:
+        drain = asyncio.ensure_future(
+            _drain_caiji_tasks(session, mirrors, tasks, deadline)
+        )
+        _caiji_background_tasks.add(drain)
+        drain.add_done_callback(_caiji_background_tasks.discard)
+
+
+############################################################################
+###############################缓存#########################################
+############################################################################
+DANMUKU_CACHE_BYTES = 128 * 1024 * 1024
+## 窗口至少能容纳一份较大的弹幕数据，否则新剧集会绕过窗口直接参与准入比较
+DANMUKU_WINDOW_BYTES = 32 * 1024 * 1024
+ANIMES_CACHE_BYTES = 8 * 1024 * 1024
+CACHE_TTL = 60
+
+_SIZE_SAMPLE = 64
+
+
+def estimate_size(obj: Any) -> int:
+    """粗略估算对象占用的字节数，大列表按抽样平均值外推"""
+    size = sys.getsizeof(obj)
+    if obj is None or isinstance(obj, (str, bytes, int, float, bool)):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        if len(obj) <= _SIZE_SAMPLE:
+            return size + sum(estimate_size(item) for item in obj)
+        step = len(obj) / _SIZE_SAMPLE
+        sampled = sum(estimate_size(obj[int(i * step)]) for i in range(_SIZE_SAMPLE))
+        return size + sampled * len(obj) // _SIZE_SAMPLE
+    if is_dataclass(obj):
+        return size + sum(estimate_size(getattr(obj, f.name)) for f in fields(obj))
+    return size
+
+
+class CountMinSketch:
+    """TinyLFU 使用的频率草图，计数达到采样上限后整体减半以淘汰旧热度"""
+
+    def __init__(self, width: int = 4096, depth: int = 4, max_count: int = 15) -> None:
+        self.width = width
+        self.max_count = max_count
+        self.sample_size = width * 10
+        self.additions = 0
+        self.seeds = [random.getrandbits(32) for _ in range(depth)]
+        self.table = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key: Hashable):
+        for row, seed in zip(self.table, self.seeds):
+            yield row, hash((seed, key)) % self.width
+
+    def increment(self, key: Hashable) -> None:
+        for row, i in self._indexes(key):
+            if row[i] < self.max_count:
+                row[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[i] for row, i in self._indexes(key))
+
+    def _reset(self) -> None:
+        for row in self.table:
+            for i, count in enumerate(row):
+                row[i] = count >> 1
+        self.additions //= 2
+
+    def clear(self) -> None:
+        self.additions = 0
+        self.table = [[0] * self.width for _ in self.table]
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+    expires_at: Optional[float]
+
+    def expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+
+class _Segment:
+    """按 LRU 顺序保存条目并记录字节占用"""
+
+    def __init__(self) -> None:
+        self.entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, key: Hashable, entry: CacheEntry) -> None:
+        self.entries[key] = entry
+        self.size += entry.size
+
+    def pop(self, key: Hashable) -> CacheEntry:
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+        return entry
+
+    def pop_lru(self) -> Tuple[Hashable, CacheEntry]:
+        key, entry = self.entries.popitem(last=False)
+        self.size -= entry.size
+        return key, entry
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+
+class WTinyLFUCache:
+    """
+    按字节限额的 W-TinyLFU 缓存
+
+    新条目先进入 LRU 窗口（取 window_ratio 与 min_window_bytes 中较大者，
+    最多占总量一半），被挤出窗口后只有在频率草图中的访问次数高于主区淘汰
+    对象时才会被接纳，从而避免一次性的大片源冲掉热门剧集。比窗口还大的
+    条目会直接参与准入比较。主区为分段 LRU：probation 中再次命中的条目晋升到
+    protected。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: Optional[float] = None,
+        window_ratio: float = 0.01,
+        protected_ratio: float = 0.8,
+        min_window_bytes: int = 0,
+        sizeof: Callable[[Any], int] = estimate_size,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.window_max = min(
+            max(int(max_bytes * window_ratio), min_window_bytes), max_bytes // 2
+        )
+        self.main_max = max_bytes - self.window_max
+        self.protected_max = int(self.main_max * protected_ratio)
+        self.window = _Segment()
+        self.probation = _Segment()
+        self.protected = _Segment()
+        self.sketch = CountMinSketch()
+        self.hits = 0
+        self.misses = 0
+        self.rejections = 0
+
+    def _segment_of(self, key: Hashable) -> Optional[_Segment]:
+        for segment in (self.window, self.probation, self.protected):
+            if key in segment:
+                return segment
+        return None
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)"""
+        self.sketch.increment(key)
+        segment = self._segment_of(key)
+        if segment is None:
+            self.misses += 1
+            return False, None
+
+        entry = segment.entries[key]
+        if entry.expired(time.monotonic()):
+            segment.pop(key)
+            self.misses += 1
+            return False, None
+
+        if segment is self.probation:
+            self.protected.add(key, self.probation.pop(key))
+            while self.protected.size > self.protected_max and len(self.protected) > 1:
+                self.probation.add(*self.protected.pop_lru())
+        else:
+            segment.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry.value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if size > self.main_max:
+            self.rejections += 1
+            return
+
+        segment = self._segment_of(key)
+        if segment is not None:
+            segment.pop(key)
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self.window.add(key, CacheEntry(value, size, expires_at))
+        while self.window.size > self.window_max:
+            self._admit(*self.window.pop_lru())
+
+    def _admit(self, key: Hashable, candidate: CacheEntry) -> None:
+        """窗口淘汰的候选者与主区 LRU 端的条目比较频率，决定是否接纳"""
+        now = time.monotonic()
+        if candidate.expired(now):
+            return
+        needed = self.probation.size + self.protected.size + candidate.size - self.main_max
+        candidate_freq = self.sketch.estimate(key)
+        victims = []
+        for segment in (self.probation, self.protected):
+            for victim_key, victim in segment.entries.items():
+                if needed <= 0:
+                    break
+                if not victim.expired(now) and self.sketch.estimate(victim_key) >= candidate_freq:
+                    self.rejections += 1
+                    return
+                victims.append((segment, victim_key))
+                needed -= victim.size
+
+        for segment, victim_key in victims:
+            segment.pop(victim_key)
+        self.probation.add(key, candidate)
+
+    def clear(self) -> None:
+        for segment in (self.window, self.probation, self.protected):
+            segment.clear()
+        self.sketch.clear()
+        self.hits = self.misses = self.rejections = 0
+
+    def purge_expired(self) -> None:
+        """清除所有已过期的条目"""
+        now = time.monotonic()
+        for segment in (self.window, self.probation, self.protected):
+            for key in [k for k, entry in segment.entries.items() if entry.expired(now)]:
+                segment.pop(key)
+
+    def info(self) -> Dict[str, Any]:
+        """缓存占用与命中率，统计前先清除过期条目"""
+        self.purge_expired()
+        lookups = self.hits + self.misses
+        used = self.window.size + self.probation.size + self.protected.size
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "rejections": self.rejections,
+            "entries": len(self.window) + len(self.probation) + len(self.protected),
+            "used_bytes": used,
+            "max_bytes": self.max_bytes,
+            "occupancy": used / self.max_bytes if self.max_bytes else 0.0,
+            "window_bytes": self.window.size,
+            "probation_bytes": self.probation.size,
+            "protected_bytes": self.protected.size,
+        }
+
+
+def tinylfu_cache(
+    max_bytes: int,
+    ttl: Optional[float] = None,
+    min_window_bytes: int = 0,
+    sizeof: Callable[[Any], int] = estimate_size,
+):
+    """
+    异步函数的 W-TinyLFU 缓存装饰器
+
+    同一参数的并发未命中请求共享同一个任务（single-flight），
+    任务成功后结果才写入缓存，异常不缓存。
+    """
+
+    def decorator(fn):
+        cache = WTinyLFUCache(
+            max_bytes, ttl=ttl, min_window_bytes=min_window_bytes, sizeof=sizeof
+        )
+        inflight: Dict[Hashable, asyncio.Future] = {}
+
+        def on_done(key: Hashable, task: asyncio.Future) -> None:
+            inflight.pop(key, None)
+            if not task.cancelled() and task.exception() is None:
+                cache.put(key, task.result())
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            found, value = cache.get(key)
+            if found:
+                return value
+
+            task = inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                inflight[key] = task
+                task.add_done_callback(functools.partial(on_done, key))
+            return await asyncio.shield(task)
+
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
 
 
 ############################################################################
@@ -535,7 +1051,7 @@ def find_episode_by_number(episodes: List[Episode], target: str) -> Optional[Epi
     return None
 
 
-@alru_cache(maxsize=32, ttl=60)
+@tinylfu_cache(ANIMES_CACHE_BYTES, ttl=CACHE_TTL)
 async def get_final_animes(douban_id: str, video_type: str) -> List[Anime]:
     # 创建实例
     source = await DoubanSource.create(douban_id, video_type)
@@ -570,7 +1086,7 @@ async def get_final_animes(douban_id: str, video_type: str) -> List[Anime]:
     return final_animes
 
 
-@alru_cache(maxsize=32, ttl=60)
+@tinylfu_cache(ANIMES_CACHE_BYTES, ttl=CACHE_TTL)
 async def get_final_animes_by_title(title: str, video_type: str) -> Anime | None:
     source = await CaijiSource.create(title)
     print(f"Title: {source.title}")
@@ -589,7 +1105,9 @@ async def get_final_animes_by_title(title: str, video_type: str) -> Anime | None
     return None
 
 
-@alru_cache(maxsize=5, ttl=60)
+@tinylfu_cache(
+    DANMUKU_CACHE_BYTES, ttl=CACHE_TTL, min_window_bytes=DANMUKU_WINDOW_BYTES
+)
 async def get_danmuku(url: str) -> DanmukuResponse:
     danmuku_url = f"https://dmku.hls.one/?ac=dm&url={url}"
     print(f"Fetching danmuku from {danmuku_url}")
@@ -668,6 +1186,15 @@ async def root_redirect():
     return RedirectResponse("/web")
 
 
+@app.get("/api/cache")
+async def cache_stats():
+    return {
+        "danmuku": get_danmuku.cache_info(),
+        "animes_by_douban": get_final_animes.cache_info(),
+        "animes_by_title": get_final_animes_by_title.cache_info(),
+    }
+
+
 @app.get("/api/comment", response_model=DanmukuResponse)
 async def danmu_by_url(
     url: Annotated[str, Query(description="视频URL")],
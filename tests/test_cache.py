@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+import main
+from main import WTinyLFUCache, tinylfu_cache
+
+
+def make_cache(max_bytes=10000, **kwargs):
+    return WTinyLFUCache(max_bytes, sizeof=lambda value: value, **kwargs)
+
+
+def touch(cache, key, times):
+    for _ in range(times):
+        cache.get(key)
+
+
+def test_byte_bound():
+    cache = make_cache()
+    for key in range(50):
+        touch(cache, key, 2)
+        cache.put(key, 700)
+    info = cache.info()
+    assert info["used_bytes"] <= cache.max_bytes
+    assert info["entries"] < 50
+
+
+def test_entry_larger_than_main_area_is_not_cached():
+    cache = make_cache()
+    cache.put("huge", cache.main_max + 1)
+    assert cache.get("huge") == (False, None)
+    assert cache.info()["rejections"] == 1
+
+
+def test_scan_resistance():
+    cache = make_cache()
+    for key in range(5):
+        touch(cache, key, 3)
+        cache.put(key, 1500)
+
+    cache.get("big")
+    cache.put("big", 5000)
+    assert cache.get("big") == (False, None)
+    assert all(cache.get(key)[0] for key in range(5))
+
+    touch(cache, "big", 10)
+    cache.put("big", 5000)
+    assert cache.get("big") == (True, 5000)
+
+
+def test_min_window_holds_large_payload():
+    cache = make_cache(max_bytes=100000, min_window_bytes=20000)
+    assert cache.window_max == 20000
+    cache.put("episode", 15000)
+    assert "episode" in cache.window
+
+
+def test_window_capped_at_half():
+    cache = make_cache(max_bytes=1000, min_window_bytes=5000)
+    assert cache.window_max == 500
+    assert cache.main_max == 500
+
+
+def test_probation_hit_promotes_to_protected():
+    cache = make_cache()
+    cache.put("a", 5000)
+    assert "a" in cache.probation
+    cache.get("a")
+    assert "a" in cache.protected
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    cache = make_cache(ttl=60)
+    cache.put("a", 100)
+    assert cache.get("a") == (True, 100)
+    now[0] += 61
+    assert cache.get("a") == (False, None)
+    assert cache.info()["entries"] == 0
+
+
+def test_hit_ratio():
+    cache = make_cache()
+    cache.get("a")
+    cache.put("a", 100)
+    cache.get("a")
+    info = cache.info()
+    assert info["hits"] == 1
+    assert info["misses"] == 1
+    assert info["hit_ratio"] == 0.5
+
+
+def test_single_flight():
+    calls = 0
+
+    @tinylfu_cache(1 << 20)
+    async def fetch(key):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [key]
+
+    async def run():
+        results = await asyncio.gather(*[fetch("a") for _ in range(10)])
+        assert all(result == ["a"] for result in results)
+        assert await fetch("a") == ["a"]
+
+    asyncio.run(run())
+    assert calls == 1
+    assert fetch.cache_info()["hits"] == 1
+
+
+def test_exceptions_are_not_cached():
+    calls = 0
+
+    @tinylfu_cache(1 << 20)
+    async def fetch(key):
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("boom")
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await fetch("a")
+
+    asyncio.run(run())
+    assert calls == 2
+    assert fetch.cache_info()["entries"] == 0
+
+
+def test_cache_clear():
+    @tinylfu_cache(1 << 20)
+    async def fetch(key):
+        return key
+
+    asyncio.run(fetch("a"))
+    fetch.cache_clear()
+    assert fetch.cache_info()["entries"] == 0
+
+
+def test_expired_window_candidate_is_not_admitted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    cache = make_cache(ttl=10)
+    cache.put("old", 5)
+    now[0] += 20
+    cache.put("new", cache.window_max)
+    assert "old" not in cache.window
+    assert "old" not in cache.probation
+    assert "old" not in cache.protected
+
+
+def test_info_excludes_expired_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    cache = make_cache(ttl=10)
+    cache.put("a", 5000)
+    cache.put("b", 50)
+    assert cache.info()["entries"] == 2
+    now[0] += 20
+    info = cache.info()
+    assert info["entries"] == 0
+    assert info["used_bytes"] == 0
+    assert info["occupancy"] == 0.0
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import main
+from main import CaijiMirror, CaijiMode
+
+DELAYS = {
+    "hang": None,
+    "fast": 0.01,
+    "fast2": 0.012,
+    "fresh1": 0.02,
+    "fresh2": 0.02,
+    "fresh3": 0.02,
+    "empty": 0.01,
+    "broken": "fail",
+}
+
+
+class FakeResponse:
+    def __init__(self, url):
+        self.url = url
+        self.status = 500 if DELAYS[url] == "fail" else 200
+
+    async def __aenter__(self):
+        delay = DELAYS[self.url]
+        if delay is None:
+            await asyncio.Event().wait()
+        elif delay != "fail":
+            await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def text(self):
+        video = {
+            "vod_name": f"title-{self.url}",
+            "type_name": "电视剧",
+            "vod_play_from": "qq",
+            "vod_play_url": f"第1集$https://v.qq.com/{self.url}",
+        }
+        videos = [] if self.url == "empty" else [video]
+        return json.dumps({"code": 1, "list": videos})
+
+
+class FakeSession:
+    def get(self, url, **kwargs):
+        return FakeResponse(url)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def mirrors(monkeypatch):
+    def configure(*urls, max_parallel=2):
+        configured = [CaijiMirror(url) for url in urls]
+        monkeypatch.setattr(main, "CAIJI_MIRRORS", configured)
+        monkeypatch.setattr(main, "CAIJI_MAX_PARALLEL", max_parallel)
+        monkeypatch.setattr(main, "_caiji_search_count", 0)
+        return configured
+
+    monkeypatch.setattr(main.aiohttp, "ClientSession", FakeSession)
+    monkeypatch.setattr(main, "CAIJI_MIN_GRACE", 0.05)
+    return configure
+
+
+async def search(title="x", mode=CaijiMode.first):
+    result = await main.fetch_videos_from_caiji(title, mode)
+    await asyncio.gather(*main._caiji_background_tasks)
+    return result
+
+
+def test_hanging_mirror_drops_out(mirrors, monkeypatch):
+    monkeypatch.setattr(main, "CAIJI_PROBE_INTERVAL", 1000)
+    hang, fast, fresh1, fresh2, fresh3 = mirrors(
+        "hang", "fast", "fresh1", "fresh2", "fresh3"
+    )
+
+    async def run():
+        for _ in range(4):
+            assert await search()
+
+    asyncio.run(run())
+    now = time.monotonic()
+    assert hang.failures >= 1
+    assert hang.score(now) > CaijiMirror.PRIOR_LATENCY
+    assert hang.score(now) > fresh3.score(now)
+    assert hang not in main.rank_caiji_mirrors()
+
+
+@pytest.mark.parametrize("mode", [CaijiMode.first, CaijiMode.merge])
+def test_no_match_does_not_wait_for_hanging_mirror(mirrors, mode):
+    empty, hang = mirrors("empty", "hang")
+
+    async def run():
+        start = time.monotonic()
+        result = await main.fetch_videos_from_caiji("x", mode)
+        elapsed = time.monotonic() - start
+        await asyncio.gather(*main._caiji_background_tasks)
+        return elapsed, result
+
+    elapsed, result = asyncio.run(run())
+    assert elapsed < 1
+    assert result == []
+    assert empty.failures == 0
+    assert hang.failures == 1
+
+
+def test_first_mode_prefers_non_empty_result(mirrors):
+    mirrors("empty", "fresh1")
+    result = asyncio.run(search())
+    assert [anime.title for anime in result] == ["title-fresh1"]
+
+
+def test_cancelled_search_does_not_penalize_mirrors(mirrors):
+    hang, fast = mirrors("hang", "fast")
+
+    async def run():
+        task = asyncio.ensure_future(main.fetch_videos_from_caiji("x"))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.gather(*main._caiji_background_tasks)
+
+    asyncio.run(run())
+    assert hang.failures == 0
+    assert fast.failures == 0
+
+
+def test_unmeasured_mirror_uses_neutral_prior(mirrors):
+    measured, fresh = mirrors("fast", "fast2", max_parallel=1)
+    measured.record_success(0.1)
+    assert main.rank_caiji_mirrors() == [measured]
+    measured.record_success(CaijiMirror.PRIOR_LATENCY * 4)
+    assert main.rank_caiji_mirrors() == [fresh]
+
+
+def test_latency_decays_toward_prior():
+    mirror = CaijiMirror("slow")
+    mirror.record_success(CaijiMirror.PRIOR_LATENCY * 5)
+    now = mirror.observed_at
+    later = now + CaijiMirror.HALF_LIFE * 10
+    assert mirror.score(later) == pytest.approx(CaijiMirror.PRIOR_LATENCY, rel=0.01)
+    assert mirror.score(later) < mirror.score(now)
+
+
+def test_demoted_mirror_is_probed(mirrors, monkeypatch):
+    monkeypatch.setattr(main, "CAIJI_PROBE_INTERVAL", 2)
+    fast, fast2, slow = mirrors("fast", "fast2", "hang")
+    fast.record_success(0.01)
+    fast2.record_success(0.01)
+    slow.record_success(10.0)
+    assert slow not in main.rank_caiji_mirrors()
+    assert slow in main.rank_caiji_mirrors()
+
+
+def test_failing_mirror_cools_down(mirrors):
+    broken, fast = mirrors("broken", "fast")
+
+    async def run():
+        for _ in range(CaijiMirror.FAILURE_THRESHOLD):
+            await search()
+
+    asyncio.run(run())
+    assert broken.retry_at > time.monotonic()
+    assert broken not in main.rank_caiji_mirrors()
+
+
+def test_merge_does_not_wait_for_hanging_mirror(mirrors):
+    mirrors("fast", "hang", "fast2", max_parallel=3)
+
+    async def run():
+        start = time.monotonic()
+        result = await main.fetch_videos_from_caiji("x", CaijiMode.merge)
+        return time.monotonic() - start, result
+
+    elapsed, result = asyncio.run(run())
+    assert elapsed < 1
+    assert [anime.title for anime in result] == ["title-fast", "title-fast2"]
+
+
+def test_merge_deduplicates_by_title_and_source():
+    anime = main.Anime("t", "qq", "电视剧", "", [])
+    other = main.Anime("t", "youku", "电视剧", "", [])
+    merged = main.merge_caiji_animes([[anime], None, [anime, other]])
+    assert merged == [anime, other]
+
+
+def test_invalid_max_parallel_fails_at_import():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, CAIJI_MAX_PARALLEL="0")
+    proc = subprocess.run(
+        [sys.executable, "-c", "import main"],
+        cwd=root,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode != 0
+    assert "CAIJI_MAX_PARALLEL" in proc.stderr